@@ -2,14 +2,13 @@ import os
 from typing import Optional, Callable
 
 import torch
-from PIL import Image
 from matplotlib import pyplot
 from pytorch_lightning import LightningDataModule
 from numpy import hstack
 from torch.utils.data import Dataset, DataLoader, random_split
 from torchvision.transforms.v2 import Resize, Compose, ToTensor, Normalize, Grayscale, ToDtype, ToImage
 
-from illust_salmap.training.utils import calculate_mean_std
+from illust_salmap.training.utils import calculate_mean_std, open_image
 from illust_salmap.downloader.downloader import Downloader
 
 
@@ -20,13 +19,16 @@ class Cat2000Dataset(Dataset):
                  root: str,
                  categories: Optional[list[str]] = None,
                  image_transform: Optional[Callable] = None,
-                 map_transform: Optional[Callable] = None):
+                 map_transform: Optional[Callable] = None,
+                 draft_size: Optional[tuple[int, int]] = None):
         self.categories = categories or ["*"]  # None の場合デフォルトで全カテゴリ
         self.image_transform = image_transform
         self.map_transform = map_transform
+        self.draft_size = draft_size
         self.downloader = Downloader(root=f"{root}/cat2000", url=self.URL)
 
-        self.image_map_pair_cache = []
+        self.image_paths: list[str] = []
+        self.map_paths: list[str] = []
         self.downloader(on_complete=self.cache_image_map_paths)
 
     def cache_image_map_paths(self):
@@ -45,16 +47,18 @@ class Cat2000Dataset(Dataset):
             stimuli_path_list = sorted((stimuli_path / category).glob("???.jpg"))
             fixation_path_list = sorted((fixation_path / category).glob("???.jpg"))
 
-            self.image_map_pair_cache.extend(zip(stimuli_path_list, fixation_path_list))
+            for image_path, map_path in zip(stimuli_path_list, fixation_path_list):
+                self.image_paths.append(str(image_path))
+                self.map_paths.append(str(map_path))
 
     def __len__(self):
-        return len(self.image_map_pair_cache)
+        return len(self.image_paths)
 
     def __getitem__(self, index: int):
-        image_path, map_path = self.image_map_pair_cache[index]
+        image_path, map_path = self.image_paths[index], self.map_paths[index]
 
-        image = Image.open(image_path).convert("RGB")
-        map_image = Image.open(map_path).convert("L")
+        image = open_image(image_path, "RGB", self.draft_size)
+        map_image = open_image(map_path, "L", self.draft_size)
 
         if self.image_transform is not None:
             image = self.image_transform(image)
@@ -67,30 +71,41 @@ class Cat2000Dataset(Dataset):
 
 class Cat2000(LightningDataModule):
     def __init__(self, root: str = "./data", batch_size: int = 32, num_workers: int = os.cpu_count(),
-                 img_size=(256, 384), image_transform=None, map_transform=None):
+                 img_size=(256, 384), image_transform=None, map_transform=None, batch_transform=None):
         super().__init__()
         self.root = root
         self.batch_size = batch_size
         self.num_workers = num_workers
+        self.img_size = img_size
+        # 独自の変換では最終的な解像度が分からないので、既定の変換のときだけ縮小デコードする
+        self.draft_size = img_size if image_transform is None and map_transform is None else None
 
         self.image_transform = image_transform or Compose([
             Resize(img_size),
-            ToTensor(),
-            Normalize([0.5], [0.5])
+            ToImage(),
         ])
 
         self.map_transform = map_transform or Compose([
             Grayscale(),
             Resize(img_size),
-            ToTensor(),
-            Normalize([0.5], [0.5])
+            ToImage(),
         ])
 
+        # 既定の変換を使う場合のみ uint8 のまま転送し、デバイス上で正規化する
+        # (独自の変換が指定された側には batch_transform を指定しない限り何もしない)
+        device_normalize = Compose([
+            ToDtype(torch.float32, scale=True),
+            Normalize([0.5], [0.5]),
+        ])
+        self.image_batch_transform = batch_transform or (device_normalize if image_transform is None else None)
+        self.map_batch_transform = batch_transform or (device_normalize if map_transform is None else None)
+
     def prepare_data(self):
         Cat2000Dataset(self.root)
 
     def setup(self, stage: str = None):
-        cat2000 = Cat2000Dataset(self.root, map_transform=self.map_transform, image_transform=self.image_transform)
+        cat2000 = Cat2000Dataset(self.root, map_transform=self.map_transform, image_transform=self.image_transform,
+                                 draft_size=self.draft_size)
         total = len(cat2000)
 
         n_train = int(total * 0.7)
@@ -106,6 +121,17 @@ class Cat2000(LightningDataModule):
         if stage == "test" or stage is None:
             self.test = test
 
+    def on_after_batch_transfer(self, batch, dataloader_idx: int):
+        image, ground_truth = batch
+
+        if self.image_batch_transform is not None:
+            image = self.image_batch_transform(image)
+
+        if self.map_batch_transform is not None:
+            ground_truth = self.map_batch_transform(ground_truth)
+
+        return image, ground_truth
+
     def train_dataloader(self) -> DataLoader:
         return DataLoader(
             self.train,
@@ -1,14 +1,16 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-from PIL import Image
+import torch
 from matplotlib import pyplot
 from pytorch_lightning import LightningDataModule
 from torch.utils.data import DataLoader, Dataset, random_split
 from torchvision import transforms
-from torchvision.transforms.v2 import Compose, Grayscale, Normalize, Resize, ToTensor, Transform
+from torchvision.transforms.v2 import Compose, Grayscale, Normalize, Resize, ToDtype, ToImage, ToTensor, Transform
 
 from illust_salmap.downloader.downloader import Downloader
-from illust_salmap.training.utils import calculate_mean_std
+from illust_salmap.training.utils import calculate_mean_std, open_image
 
 
 class Imp1kCategories:
@@ -19,6 +21,12 @@ class Imp1kCategories:
     all = [ads, infographics, movie_posters, webpages]
 
 
+def _sorted_files(directory: Path) -> list[str]:
+    # glob より軽量な scandir で一覧を取得する
+    with os.scandir(directory) as entries:
+        return sorted(entry.path for entry in entries if entry.is_file())
+
+
 class Imp1kDataset(Dataset):
     URL = "https://predimportance.mit.edu/data/imp1k.zip"
 
@@ -26,13 +34,15 @@ class Imp1kDataset(Dataset):
                  root,
                  categories=None,
                  image_transform=None,
-                 map_transform=None
+                 map_transform=None,
+                 draft_size=None
                  ):
 
         self.categories = categories or Imp1kCategories.all
 
         self.image_transform = image_transform
         self.map_transform = map_transform
+        self.draft_size = draft_size
 
         print(f"url: {self.URL}")
 
@@ -41,27 +51,38 @@ class Imp1kDataset(Dataset):
         self.downloader()
 
         # 画像とマップのペアを取得
-        self.image_map_pair_cache = []
+        self.image_paths: list[str] = []
+        self.map_paths: list[str] = []
         self.cache_image_map_paths()
 
     def cache_image_map_paths(self):
+        # カテゴリごとのディレクトリ走査はI/O待ちが主なのでスレッドで並行に行う
+        with ThreadPoolExecutor(max_workers=len(self.categories) or 1) as executor:
+            listings = list(executor.map(self._list_category, self.categories))
+
+        for images_path_list, maps_path_list in listings:
+            self.image_paths.extend(images_path_list)
+            self.map_paths.extend(maps_path_list)
+
+    def _list_category(self, category: str) -> tuple[list[str], list[str]]:
+        images_path_list = _sorted_files(self.downloader.extract_path / "imgs" / category)
+        maps_path_list = _sorted_files(self.downloader.extract_path / "maps" / category)
 
-        for category in self.categories:
-            images_dir = self.downloader.extract_path / "imgs" / category
-            maps_dir = self.downloader.extract_path / "maps" / category
-            images_path_list = sorted(images_dir.glob("*"))
-            maps_path_list = sorted(maps_dir.glob("*"))
+        if len(images_path_list) != len(maps_path_list):
+            raise ValueError(
+                f"画像とマップの数が一致しません ({category}: {len(images_path_list)} != {len(maps_path_list)})"
+            )
 
-            self.image_map_pair_cache.extend((zip(images_path_list, maps_path_list)))
+        return images_path_list, maps_path_list
 
     def __len__(self):
-        return len(self.image_map_pair_cache)
+        return len(self.image_paths)
 
     def __getitem__(self, index: int):
-        image_path, map_path = self.image_map_pair_cache[index]
+        image_path, map_path = self.image_paths[index], self.map_paths[index]
 
-        image = Image.open(image_path).convert("RGB")
-        map_image = Image.open(map_path).convert("L")
+        image = open_image(image_path, "RGB", self.draft_size)
+        map_image = open_image(map_path, "L", self.draft_size)
 
         if self.image_transform is not None:
             image = self.image_transform(image)
@@ -79,18 +100,23 @@ class Imp1k(LightningDataModule):
         self.root = root
         self.batch_size = batch_size
         self.num_workers = num_workers
+        self.img_size = img_size
 
         # データ変換
         self.image_transform = Compose([
             Resize(img_size),
-            ToTensor(),
-            Normalize([0.5], [0.5]),
+            ToImage(),
         ])
 
         self.map_transform = Compose([
             Resize(img_size),
             Grayscale(),
-            ToTensor(),
+            ToImage(),
+        ])
+
+        # uint8 のまま転送し、デバイス上で正規化する
+        self.batch_transform = Compose([
+            ToDtype(torch.float32, scale=True),
             Normalize([0.5], [0.5]),
         ])
 
@@ -98,7 +124,8 @@ class Imp1k(LightningDataModule):
         Imp1kDataset(self.root)
 
     def setup(self, stage: str = None):
-        imp1k = Imp1kDataset(self.root, map_transform=self.map_transform, image_transform=self.image_transform)
+        imp1k = Imp1kDataset(self.root, map_transform=self.map_transform, image_transform=self.image_transform,
+                             draft_size=self.img_size)
         total = len(imp1k)
 
         n_train = int(total * 0.8)
@@ -113,14 +140,36 @@ class Imp1k(LightningDataModule):
         if stage == "test" or stage is None:
             self.test = val
 
+    def on_after_batch_transfer(self, batch, dataloader_idx: int):
+        image, ground_truth = batch
+        return self.batch_transform(image), self.batch_transform(ground_truth)
+
     def train_dataloader(self) -> DataLoader:
-        return DataLoader(self.train, batch_size=self.batch_size, num_workers=self.num_workers)
+        return DataLoader(
+            self.train,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            pin_memory=True,
+        )
 
     def val_dataloader(self) -> DataLoader:
-        return DataLoader(self.val, batch_size=self.batch_size, num_workers=self.num_workers)
+        return DataLoader(
+            self.val,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            pin_memory=True,
+        )
 
     def test_dataloader(self) -> DataLoader:
-        return DataLoader(self.test, batch_size=self.batch_size, num_workers=self.num_workers)
+        return DataLoader(
+            self.test,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            pin_memory=True,
+        )
 
 
 class PadToSquare(Transform):
@@ -1,12 +1,12 @@
 import os
 from typing import Optional, Callable
 
-from PIL import Image
+import torch
 from pytorch_lightning import LightningDataModule
 from torch.utils.data import Dataset, DataLoader, random_split
-from torchvision.transforms.v2 import Normalize, ToTensor, Compose, Resize, Grayscale
+from torchvision.transforms.v2 import Normalize, ToTensor, Compose, Resize, Grayscale, ToDtype, ToImage
 
-from illust_salmap.training.utils import calculate_mean_std
+from illust_salmap.training.utils import calculate_mean_std, open_image
 from illust_salmap.downloader import GoogleDriveDownloader, handle_download
 from matplotlib import pyplot
 
@@ -19,13 +19,15 @@ class SALICONDataset(Dataset):
                  root: str,
                  categories=None,
                  image_transform: Optional[Callable] = None,
-                 map_transform: Optional[Callable] = None
+                 map_transform: Optional[Callable] = None,
+                 draft_size: Optional[tuple[int, int]] = None
                  ):
 
         self.categories = categories or ["test", "train"]
 
         self.image_transform = image_transform
         self.map_transform = map_transform
+        self.draft_size = draft_size
 
         self.image_downloader = GoogleDriveDownloader(f"{root}/salicon", self.IMAGE_ID, zip_filename="images.zip")
         self.map_downloader = GoogleDriveDownloader(f"{root}/salicon", self.MAPS_ID, zip_filename="maps.zip")
@@ -36,7 +38,8 @@ class SALICONDataset(Dataset):
         ])
 
         # 画像とマップのペアを取得
-        self.image_map_pair_cache = []
+        self.image_paths: list[str] = []
+        self.map_paths: list[str] = []
         self.cache_image_map_paths()
 
     def cache_image_map_paths(self):
@@ -47,16 +50,18 @@ class SALICONDataset(Dataset):
             images_path_list = sorted(images_dir.glob("*.jpg"))
             maps_path_list = sorted(maps_dir.glob("*.png"))
 
-            self.image_map_pair_cache.extend(zip(images_path_list, maps_path_list))
+            for image_path, map_path in zip(images_path_list, maps_path_list):
+                self.image_paths.append(str(image_path))
+                self.map_paths.append(str(map_path))
 
     def __len__(self):
-        return len(self.image_map_pair_cache)
+        return len(self.image_paths)
 
     def __getitem__(self, index: int):
-        image_path, map_path = self.image_map_pair_cache[index]
+        image_path, map_path = self.image_paths[index], self.map_paths[index]
 
-        image = Image.open(image_path).convert("RGB")
-        map_image = Image.open(map_path).convert("L")
+        image = open_image(image_path, "RGB", self.draft_size)
+        map_image = open_image(map_path, "L", self.draft_size)
 
         if self.image_transform is not None:
             image = self.image_transform(image)
@@ -78,22 +83,27 @@ class SALICON(LightningDataModule):
         # データ変換
         self.image_transform = Compose([
             Resize(self.img_size),
-            ToTensor(),
-            Normalize([0.5], [0.5])
+            ToImage(),
         ])
 
         self.map_transform = Compose([
             Resize(self.img_size),
             Grayscale(),
-            ToTensor(),
-            Normalize([0.5], [0.5])
+            ToImage(),
+        ])
+
+        # uint8 のまま転送し、デバイス上で正規化する
+        self.batch_transform = Compose([
+            ToDtype(torch.float32, scale=True),
+            Normalize([0.5], [0.5]),
         ])
 
     def prepare_data(self):
         SALICONDataset(self.root)
 
     def setup(self, stage: str = None):
-        salicon = SALICONDataset(self.root, map_transform=self.map_transform, image_transform=self.image_transform)
+        salicon = SALICONDataset(self.root, map_transform=self.map_transform, image_transform=self.image_transform,
+                                 draft_size=self.img_size)
         total = len(salicon)
 
         n_train = int(total * 0.8)
@@ -108,14 +118,36 @@ class SALICON(LightningDataModule):
         if stage == "test" or stage is None:
             self.test = val
 
+    def on_after_batch_transfer(self, batch, dataloader_idx: int):
+        image, ground_truth = batch
+        return self.batch_transform(image), self.batch_transform(ground_truth)
+
     def train_dataloader(self) -> DataLoader:
-        return DataLoader(self.train, batch_size=self.batch_size, num_workers=self.num_workers)
+        return DataLoader(
+            self.train,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            pin_memory=True,
+        )
 
     def val_dataloader(self) -> DataLoader:
-        return DataLoader(self.val, batch_size=self.batch_size, num_workers=self.num_workers)
+        return DataLoader(
+            self.val,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            pin_memory=True,
+        )
 
     def test_dataloader(self) -> DataLoader:
-        return DataLoader(self.test, batch_size=self.batch_size, num_workers=self.num_workers)
+        return DataLoader(
+            self.test,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
+            pin_memory=True,
+        )
 
 
 if __name__ == '__main__':
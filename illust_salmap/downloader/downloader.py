@@ -157,19 +157,17 @@ class Downloader:
         """
         self.logger.info(f"Unzipping {self.zip_path}...")
         with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-            top_level_dirs = {Path(x).parts[0] for x in zip_ref.namelist()}
+            file_names = zip_ref.namelist()
+            top_level_dirs = {Path(x).parts[0] for x in file_names}
 
             if len(top_level_dirs) == 1:
                 top_level_dir = next(iter(top_level_dirs))
                 self.extract_path = self._root / top_level_dir
                 self.logger.info(f"Extracting into {self.extract_path}...")
 
-            total_files = len(zip_ref.namelist())
-            with tqdm(total=total_files, unit='file') as progress:
-                for file in zip_ref.namelist():
-                    destination = self._root if len(top_level_dirs) == 1 else self.extract_path
-                    zip_ref.extract(file, destination)
-                    progress.update(1)
+            destination = self._root if len(top_level_dirs) == 1 else self.extract_path
+            for file in tqdm(file_names, unit='file', mininterval=1.0):
+                zip_ref.extract(file, destination)
 
         self.logger.info(f"Extracted successfully to {self.extract_path}.")
 
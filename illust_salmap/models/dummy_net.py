@@ -8,12 +8,12 @@ class DummyNet(Module):
         self.encoder = Sequential(
             Conv2d(in_channels, 32, 3, 1, 1),
             MaxPool2d(2, 2),
-            LeakyReLU(),
+            LeakyReLU(inplace=True),
         )
 
         self.decoder = Sequential(
             ConvTranspose2d(32, classes, 4, 2, 1),
-            LeakyReLU(),
+            LeakyReLU(inplace=True),
         )
 
         self.head = Sigmoid()
@@ -1,20 +1,33 @@
+from functools import cache
+
 import torch
-from torch.ao.nn.quantized import ConvTranspose2d
-from torch.nn import Module, Sequential, Conv2d, LeakyReLU, BatchNorm2d, Tanh
+from torch.nn import Module, Sequential, Conv2d, ConvTranspose2d, LeakyReLU, BatchNorm2d, Tanh
 from torchinfo import summary
-from torchvision.models import vgg16_bn, VGG16_BN_Weights
+from torchvision.models import VGG16_BN_Weights
+from torchvision.models.vgg import make_layers, cfgs
+
+
+@cache
+def _pretrained_features_state() -> dict[str, torch.Tensor]:
+    # 学習済み重みの読み込みは一度だけ行い、インスタンスごとに load_state_dict でコピーする
+    # 使わない classifier の重みは保持しない
+    state = VGG16_BN_Weights.IMAGENET1K_V1.get_state_dict(progress=True, check_hash=True)
+    prefix = "features."
+    return {key.removeprefix(prefix): value for key, value in state.items() if key.startswith(prefix)}
 
 
 class SalGANGenerator(Module):
     def __init__(self, head=Tanh()):
         super().__init__()
-        backbone = vgg16_bn(VGG16_BN_Weights.IMAGENET1K_V1)
+        # classifier まで含む VGG16-BN 全体は作らず、特徴抽出部だけを構築する
+        features = make_layers(cfgs["D"], batch_norm=True)
+        features.load_state_dict(_pretrained_features_state())
 
-        encoder_fist: Module = backbone.features[:17]
+        encoder_fist: Module = features[:17]
         for param in encoder_fist.parameters():
             param.requires_grad = False
 
-        encoder_last = backbone.features[17:-1]
+        encoder_last = features[17:-1]
 
         self.encoder = Sequential(
             encoder_fist,
@@ -37,7 +50,7 @@ class SalGANGenerator(Module):
 
 
 class DecoderBlock(Module):
-    def __init__(self, in_channels, out_channels, activation=LeakyReLU()):
+    def __init__(self, in_channels, out_channels, activation=LeakyReLU(inplace=True)):
         super().__init__()
         self.upsample = ConvTranspose2d(in_channels, in_channels, 4, 2, 1)
         self.conv1 = Conv2d(in_channels, in_channels, 3, 1, 1)
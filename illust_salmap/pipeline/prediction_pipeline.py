@@ -12,24 +12,32 @@ class PredictionPipeline:
             model: Module,
             ckpt_path: Path,
             preprocess: Transform | callable,
-            postprocess: Transform | callable, ):
+            postprocess: Transform | callable,
+            autocast_dtype: torch.dtype | None = None, ):
         self.model = model.load_from_checkpoint(ckpt_path)
         self.model.eval()
         self.preprocess = preprocess
         self.postprocess = postprocess
+        self.autocast_dtype = autocast_dtype
 
     @torch.no_grad()
     def prediction(self, images: list[Image]):
         batch = self.preprocess(images)
 
-        predict = self.model(batch)
+        with torch.autocast(self.model.device.type, dtype=self.autocast_dtype, enabled=self._use_autocast()):
+            predict = self.model(batch).float()
 
-        result = self.postprocess(predict)
+        return self.postprocess(predict)
 
-        del predict, batch
-        torch.cuda.empty_cache()
+    def _use_autocast(self) -> bool:
+        if self.autocast_dtype is None or self.model.device.type != "cuda":
+            return False
 
-        return result
+        # エミュレーションの bf16 (Ampere 未満の GPU) ではかえって遅くなるので使わない
+        if self.autocast_dtype == torch.bfloat16:
+            return torch.cuda.is_bf16_supported(including_emulation=False)
+
+        return True
 
 if __name__ == '__main__':
     from torchvision.transforms.v2 import Compose, Resize, ToTensor
@@ -1,9 +1,21 @@
 import torch
 from torch import Tensor
 from torchmetrics import KLDivergence, AUROC, CosineSimilarity, SpearmanCorrCoef
+from torchmetrics.classification import BinaryStatScores
 from torchmetrics.image import SpatialCorrelationCoefficient
 
 
+class BinarizedAUROC(BinaryStatScores):
+    # convert_auroc / convert_all で {0, 1} に二値化した予測専用の AUROC
+    # ROC 曲線は (0, 0) - (FPR, TPR) - (1, 1) の折れ線になるので、面積は (1 + TPR - FPR) / 2 で求まる
+    # 状態は TP / FP / TN / FN のみで、入力した画素数に依存しない
+    def compute(self) -> Tensor:
+        tp, fp, tn, fn = self._final_state()
+        tpr = tp / (tp + fn).clamp_min(1)
+        fpr = fp / (fp + tn).clamp_min(1)
+        return (1 + tpr - fpr) / 2
+
+
 @torch.no_grad()
 def convert_kl_div(predict_img: Tensor, target_img: Tensor, epsilon: float = 1e-8) -> tuple[Tensor, Tensor]:
     predict_dist = torch.flatten(predict_img, start_dim=1) + 1
@@ -24,8 +36,8 @@ def convert_auroc(predict_img: Tensor, target_img: Tensor) -> tuple[Tensor, Tens
 
 @torch.no_grad()
 def convert_sim(predict_img: Tensor, target_img: Tensor) -> tuple[Tensor, Tensor]:
-    predict_img = predict_img.view(predict_img.size(0), -1)  # (B, C * W * H)
-    target_img = target_img.view(target_img.size(0), -1)  # (B, C * W * H)
+    predict_img = torch.flatten(predict_img, start_dim=1)  # (B, C * W * H)
+    target_img = torch.flatten(target_img, start_dim=1)  # (B, C * W * H)
 
     predict_norm = torch.norm(predict_img, dim=1, keepdim=True)
     target_norm = torch.norm(target_img, dim=1, keepdim=True)
@@ -41,16 +53,35 @@ def convert_scc(predict_img: Tensor, target_img: Tensor) -> tuple[Tensor, Tensor
     return predict_normalized, target_normalized
 
 
+@torch.no_grad()
+def convert_all(predict_img: Tensor, target_img: Tensor, epsilon: float = 1e-8) -> dict[str, tuple[Tensor, Tensor]]:
+    # convert_* を個別に呼ぶと flatten と正規化が重複するため、共通部分を一度だけ計算する
+    predict_flat = torch.flatten(predict_img, start_dim=1)  # (B, C * W * H)
+    target_flat = torch.flatten(target_img, start_dim=1)  # (B, C * W * H)
+    predict_normalized = normalized(predict_img)
+    target_normalized = normalized(target_img)
+
+    # softmax は定数シフトで不変なので convert_kl_div の +1 は省略できる
+    kl_div = (predict_flat.softmax(dim=1) + epsilon, target_flat.softmax(dim=1) + epsilon)
+    sim = (
+        predict_flat / torch.norm(predict_flat, dim=1, keepdim=True),
+        target_flat / torch.norm(target_flat, dim=1, keepdim=True),
+    )
+    scc = (predict_normalized, target_normalized)
+    auroc = ((predict_normalized > 0.5).float(), (target_normalized > 0.5).float())
+
+    return {"kl_div": kl_div, "sim": sim, "scc": scc, "auroc": auroc}
+
+
 @torch.no_grad()
 def normalized(target: Tensor) -> Tensor:
     min_value = target.min()
-    max_value = target.max()
-    if min_value == max_value:
-        return target
+    value_range = target.max() - min_value
 
     # min と max の範囲に基づいて正規化
-    result = (target - min_value) / (max_value - min_value)
-    return result
+    # Python の if で比較するとデバイスとの同期が発生するため torch.where で分岐する
+    result = (target - min_value) / value_range
+    return torch.where(value_range > 0, result, target)
 
 
 if __name__ == '__main__':
@@ -6,10 +6,10 @@ from pytorch_lightning.utilities.types import STEP_OUTPUT
 from torch import Tensor
 from torch.nn import MSELoss, Module
 from torch.optim import Adam
-from torchmetrics import AUROC, CosineSimilarity, KLDivergence
+from torchmetrics import CosineSimilarity, KLDivergence
 from torchmetrics.image import SpatialCorrelationCoefficient
 
-from illust_salmap.training.metrics import convert_auroc, convert_kl_div, convert_scc, convert_sim, normalized
+from illust_salmap.training.metrics import BinarizedAUROC, convert_all, normalized
 from illust_salmap.training.utils import generate_plot
 
 
@@ -18,24 +18,31 @@ class SaliencyModel(LightningModule):
             self,
             model: Module,
             criterion: Module = MSELoss(),
-            optimization_builder: callable = lambda params: Adam(params, lr=0.0001)
+            optimization_builder: callable = lambda params: Adam(params, lr=0.0001),
+            compile_model: bool = False,
     ):
         super().__init__()
-        self.model = model
+        self.model = model.to(memory_format=torch.channels_last)
+        if compile_model:
+            # モジュールをその場でコンパイルするので state_dict のキーは変わらない
+            self.model.compile(mode="reduce-overhead")
         self.criterion = criterion
         self.optimization_builder = optimization_builder
 
         self.val_kl_div = KLDivergence()
         self.val_sim = CosineSimilarity(reduction="mean")
         self.val_scc = SpatialCorrelationCoefficient()
-        self.val_auroc = AUROC("binary")
+        self.val_auroc = BinarizedAUROC()
 
         self.test_kl_div = KLDivergence()
         self.test_sim = CosineSimilarity(reduction="mean")
         self.test_scc = SpatialCorrelationCoefficient()
-        self.test_auroc = AUROC("binary")
+        self.test_auroc = BinarizedAUROC()
 
     def forward(self, x):
+        # channels_last は 4 次元テンソルにしか指定できないため、バッチなしの (C, H, W) はそのまま渡す
+        if x.dim() == 4:
+            x = x.contiguous(memory_format=torch.channels_last)
         return self.model(x)
 
     def configure_optimizers(self):
@@ -47,7 +54,7 @@ class SaliencyModel(LightningModule):
 
         loss = self.criterion(predict, ground_truth)
 
-        return {"loss": loss, "predict": predict}
+        return {"loss": loss}
 
     def on_train_batch_end(self, outputs: STEP_OUTPUT, batch: Any, batch_idx: int) -> None:
         loss = outputs["loss"]
@@ -73,15 +80,12 @@ class SaliencyModel(LightningModule):
         predict = outputs["val_predict"]
         image, ground_truth = batch
 
-        kl_div_pred, kl_div_ground = convert_kl_div(predict, ground_truth)
-        sim_pred, sim_ground = convert_sim(predict, ground_truth)
-        scc_pred, scc_ground = convert_scc(predict, ground_truth)
-        auroc_pred, auroc_ground = convert_auroc(predict, ground_truth)
+        converted = convert_all(predict, ground_truth)
 
-        self.val_kl_div(kl_div_pred, kl_div_ground)
-        self.val_sim(sim_pred, sim_ground)
-        self.val_scc(scc_pred, scc_ground)
-        self.val_auroc(auroc_pred, auroc_ground)
+        self.val_kl_div(*converted["kl_div"])
+        self.val_sim(*converted["sim"])
+        self.val_scc(*converted["scc"])
+        self.val_auroc(*converted["auroc"])
 
         self.log("val_loss", loss, on_step=False, on_epoch=True, enable_graph=False)
         self.log("val_kl_div", self.val_kl_div, on_step=False, on_epoch=True, enable_graph=False)
@@ -92,9 +96,6 @@ class SaliencyModel(LightningModule):
         if batch_idx == 0:
             self.save_image("validation", self.trainer.current_epoch, image, ground_truth, predict)
 
-    def on_validation_epoch_end(self) -> None:
-        torch.cuda.empty_cache()
-
     def test_step(self, batch, batch_idx):
         image, ground_truth = batch
         predict = self.forward(image)
@@ -109,15 +110,12 @@ class SaliencyModel(LightningModule):
         predict = outputs["test_predict"]
         image, ground_truth = batch
 
-        kl_div_pred, kl_div_ground = convert_kl_div(predict, ground_truth)
-        sim_pred, sim_ground = convert_sim(predict, ground_truth)
-        scc_pred, scc_ground = convert_scc(predict, ground_truth)
-        auroc_pred, auroc_ground = convert_auroc(predict, ground_truth)
+        converted = convert_all(predict, ground_truth)
 
-        self.test_kl_div(kl_div_pred, kl_div_ground)
-        self.test_sim(sim_pred, sim_ground)
-        self.test_scc(scc_pred, scc_ground)
-        self.test_auroc(auroc_pred, auroc_ground)
+        self.test_kl_div(*converted["kl_div"])
+        self.test_sim(*converted["sim"])
+        self.test_scc(*converted["scc"])
+        self.test_auroc(*converted["auroc"])
 
         self.log("test_loss", loss, on_step=False, on_epoch=True, prog_bar=True, enable_graph=False)
         self.log("test_kl_div", self.test_kl_div, on_step=False, on_epoch=True, prog_bar=True, enable_graph=False)
@@ -128,9 +126,6 @@ class SaliencyModel(LightningModule):
         if batch_idx == self.trainer.num_test_batches[0] - 1:
             self.save_image("test", self.trainer.current_epoch, image, ground_truth, predict)
 
-    def on_test_epoch_end(self) -> None:
-        torch.cuda.empty_cache()
-
     @torch.no_grad()
     def save_image(self, stage: str, epoch: int, images: Tensor, ground_truths: Tensor, predicts: Tensor) -> None:
         images = normalized(images)
@@ -138,6 +133,11 @@ class SaliencyModel(LightningModule):
         predicts = normalized(predicts)
         title = f"{stage}_images: {epoch}"
 
-        plot = generate_plot(title, {"input": images[0], "ground_truth": ground_truths[0], "predict": predicts[0]})
+        # 先頭サンプルだけをまとめて1回でCPUへ転送する
+        channels = [images.size(1), ground_truths.size(1), predicts.size(1)]
+        samples = torch.cat([images[:1], ground_truths[:1], predicts[:1]], dim=1)[0].cpu()
+        image, ground_truth, predict = torch.split(samples, channels)
+
+        plot = generate_plot(title, {"input": image, "ground_truth": ground_truth, "predict": predict})
 
         self.logger.experiment.add_image(f"{stage}_images", plot, global_step=epoch)
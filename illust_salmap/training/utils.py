@@ -1,4 +1,3 @@
-import io
 import random
 from pathlib import Path
 
@@ -7,7 +6,6 @@ import matplotlib.pyplot as plt
 import numpy as np
 import numpy.random
 import torch
-import torchvision.transforms.functional as F
 from PIL import Image
 from numpy import ndarray
 from torch import cuda, backends, Tensor
@@ -43,6 +41,18 @@ def get_checkpoint_path(root: str | Path, datamodule, model: Module):
     return get_save_path(root, datamodule, model) / "checkpoints"
 
 
+def open_image(path: str | Path, mode: str, draft_size: int | tuple[int, int] | None = None) -> Image.Image:
+    image = Image.open(path)
+
+    if draft_size is not None:
+        # JPEG は draft で縮小デコードさせる (draft_size 以上の解像度は保たれる / PNG などでは何もしない)
+        # int は Resize と同じく短辺の長さとして扱う
+        height, width = (draft_size, draft_size) if isinstance(draft_size, int) else draft_size
+        image.draft(mode, (width, height))
+
+    return image.convert(mode)
+
+
 def calculate_mean_std(dataset, image=True, ground_truth=True):
     # 画像とサリエンシーマップの平均と標準偏差を格納する
     image_mean = torch.zeros(3, dtype=torch.float32)  # RGB画像の3チャネル分
@@ -54,7 +64,8 @@ def calculate_mean_std(dataset, image=True, ground_truth=True):
     num_images = len(dataset)
 
     # 画像とサリエンシーマップに対して計算
-    for image_path, map_path in tqdm(dataset.image_map_pair_cache, desc="Calculating mean and std"):
+    path_pairs = zip(dataset.image_paths, dataset.map_paths)
+    for image_path, map_path in tqdm(path_pairs, total=num_images, desc="Calculating mean and std", mininterval=1.0):
         # 画像とサリエンシーマップの読み込み
         if image:
             image = Image.open(image_path).convert("RGB")
@@ -89,7 +100,7 @@ def calculate_mean_std(dataset, image=True, ground_truth=True):
     return image_mean, image_std, map_mean, map_std
 
 
-def generate_plot(title: str, images: dict[str, Tensor], figsize=(11, 8), dpi=350):
+def generate_plot(title: str, images: dict[str, Tensor], figsize=(11, 8), dpi=150):
     fig, axes = plt.subplots(1, len(images.keys()), figsize=figsize, dpi=dpi)
 
     fig.suptitle(title)
@@ -97,17 +108,15 @@ def generate_plot(title: str, images: dict[str, Tensor], figsize=(11, 8), dpi=35
     for ax, (name, img) in zip(axes, images.items()):
         ax.set_title(name)
         ax.set_axis_off()
-        ax.imshow(img.permute(1, 2, 0).detach().cpu().numpy())
+        ax.imshow(img.detach().cpu().permute(1, 2, 0).numpy())
 
     plt.tight_layout()
 
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png")
-
-    pil_image = Image.open(buffer).convert("RGB")
-    tensor = F.pil_to_tensor(pil_image)
+    # PNGへのエンコードとデコードを挟まず、描画済みのRGBAバッファから直接取り出す
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    tensor = torch.from_numpy(rgba[..., :3].copy()).permute(2, 0, 1)
 
-    buffer.close()
     plt.close(fig)
     return tensor
 